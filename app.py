@@ -1,49 +1,159 @@
 import streamlit as st
 import hashlib
-import json
+import struct
+import sys
 import time
-from typing import List, Dict, Any
+from collections import defaultdict
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+import orjson
 import pandas as pd
 
+# -----------------------
+# Canonical Serialization
+# -----------------------
+_I64 = struct.Struct("<q")
+_BLOCK_SEAL = struct.Struct("<qdq")  # transaction count, timestamp, proof
+
+
+def _block_header(index: int, previous_hash: bytes) -> bytearray:
+    buf = bytearray(_I64.pack(index))
+    buf += previous_hash
+    return buf
+
+
+def _encode_transaction(tx: Dict[str, Any]) -> bytes:
+    return orjson.dumps(tx, option=orjson.OPT_SORT_KEYS)
+
+
+def _pack_block(block: Dict[str, Any]) -> bytearray:
+    buf = _block_header(block["index"], block["previous_hash"])
+    for tx in block["transactions"]:
+        buf += _encode_transaction(tx)
+    buf += _BLOCK_SEAL.pack(len(block["transactions"]), block["timestamp"], block["proof"])
+    return buf
+
+
+def _local_datetimes(timestamps: List[float]) -> np.ndarray:
+    """Convert epoch seconds to naive local datetime64[s], like time.localtime."""
+    ts = np.asarray(timestamps, dtype=np.float64)
+    # UTC offsets only change on quarter-hour boundaries, so look each one up
+    # once per distinct 15-minute bucket rather than once per timestamp.
+    buckets, inverse = np.unique(ts // 900, return_inverse=True)
+    offsets = np.array([time.localtime(b * 900).tm_gmtoff for b in buckets], dtype=np.float64)
+    return (ts + offsets[inverse]).astype("datetime64[s]")
+
+
+def _summary_frame(cols: Dict[str, List[Any]], start: int = 0) -> pd.DataFrame:
+    return pd.DataFrame({
+        "Product ID": np.asarray(cols["product_id"][start:], dtype=np.int64),
+        "Actor": pd.Categorical(cols["actor"][start:]),
+        "Action": cols["action"][start:],
+        "Location": cols["location"][start:],
+        "Amount": np.asarray(cols["amount"][start:], dtype=np.float64),
+        "Batch": cols["batch"][start:],
+        "Transport": pd.Categorical(cols["transport"][start:]),
+        "Notes": cols["notes"][start:],
+        "Receiver": cols["receiver"][start:],
+        "Timestamp": _local_datetimes(cols["timestamp"][start:]),
+        "Block": np.asarray(cols["block_index"][start:], dtype=np.int64),
+    }, index=range(start, len(cols["block_index"])))
+
+
+# The cache is shared by every session while each session owns its own chain,
+# so entries are keyed on the genesis hash as well as the chain length.
+@st.cache_data(show_spinner=False, max_entries=100)
+def _build_summary(chain_key: bytes, chain_version: int, _cols: Dict[str, List[Any]]) -> pd.DataFrame:
+    return _summary_frame(_cols)
+
+
+@st.cache_data(show_spinner=False, max_entries=100)
+def _recent_summary(chain_key: bytes, chain_version: int, _cols: Dict[str, List[Any]], n: int = 10) -> pd.DataFrame:
+    return _summary_frame(_cols, max(0, len(_cols["block_index"]) - n))
+
+
 # -----------------------
 # Blockchain Class
 # -----------------------
+MAX_TX_PER_BLOCK = 100
+DEFAULT_PROOF = 123
+
+
 class SupplyChainBlockchain:
     def __init__(self):
         self.chain: List[Dict[str, Any]] = []
-        self.pending_transactions: List[Dict[str, Any]] = []
+        # Fixed-capacity pending buffer filled up to _pending_n; a full buffer
+        # seals a block, so adding transactions never grows the list.
+        self._pending: List[Optional[Dict[str, Any]]] = [None] * MAX_TX_PER_BLOCK
+        self._pending_n = 0
         self.product_counter = 0
-        self.new_block(proof=100, previous_hash="1")
+        self._by_product: Dict[int, List[Tuple[int, Dict[str, Any]]]] = defaultdict(list)
+        self._cols: Dict[str, List[Any]] = {
+            field: [] for field in ("product_id", "actor", "action", "location", "amount", "batch",
+                                    "transport", "notes", "receiver", "timestamp", "block_index")
+        }
+        self._valid_through_index = 0
+        self._pending_previous_hash = None
+        self._pending_hasher = None
+        self.new_block(proof=100, previous_hash=bytes(32))
+
+    def _start_pending_block(self, previous_hash: bytes) -> None:
+        # The next block's header and transactions are fed to the hasher as they
+        # become known, leaving only the seal fields for new_block to add.
+        self._pending_previous_hash = previous_hash
+        self._pending_hasher = hashlib.sha256(_block_header(len(self.chain) + 1, previous_hash))
+        for tx in self.pending_snapshot:
+            self._pending_hasher.update(_encode_transaction(tx))
 
-    def new_block(self, proof: int, previous_hash: str = None) -> Dict[str, Any]:
-        block_transactions = [tx.copy() for tx in self.pending_transactions]
+    def new_block(self, proof: int, previous_hash: bytes = None) -> Dict[str, Any]:
+        previous_hash = previous_hash or self.last_block["hash"]
+        if previous_hash != self._pending_previous_hash:
+            self._start_pending_block(previous_hash)
+        n = self._pending_n
+        block_transactions = self._pending[:n]
+        self._pending[:n] = [None] * n
+        self._pending_n = 0
         block = {
             "index": len(self.chain) + 1,
             "timestamp": time.time(),
             "transactions": block_transactions,
             "proof": proof,
-            "previous_hash": previous_hash or self.hash(self.chain[-1]),
+            "previous_hash": previous_hash,
         }
-        self.pending_transactions = []
-        block["hash"] = self.hash(block)
+        self._pending_hasher.update(_BLOCK_SEAL.pack(len(block_transactions), block["timestamp"], proof))
+        block["hash"] = self._pending_hasher.digest()
         self.chain.append(block)
+        for tx in block_transactions:
+            self._by_product[tx["product_id"]].append((block["index"], tx))
+            for field, column in self._cols.items():
+                if field != "block_index":
+                    column.append(tx[field])
+        self._cols["block_index"].extend([block["index"]] * len(block_transactions))
+        self._start_pending_block(block["hash"])
         return block
 
     def add_transaction(self, product_id: int, actor: str, location: str, action: str,
                         amount: float, batch: str, transport: str, notes: str, receiver: str) -> int:
         transaction = {
-            "product_id": product_id,
-            "actor": actor,
+            "product_id": int(product_id),
+            # Picked from fixed selectbox options; interning shares one object each
+            "actor": sys.intern(actor),
             "location": location,
             "action": action,
-            "amount": amount,
+            "amount": float(amount),
             "batch": batch,
-            "transport": transport,
+            "transport": sys.intern(transport),
             "notes": notes,
             "receiver": receiver,
             "timestamp": time.time()
         }
-        self.pending_transactions.append(transaction)
+        # Encode before buffering so a value orjson rejects leaves nothing behind
+        encoded = _encode_transaction(transaction)
+        self._pending[self._pending_n] = transaction
+        self._pending_n += 1
+        self._pending_hasher.update(encoded)
+        if self._pending_n == MAX_TX_PER_BLOCK:
+            self.new_block(proof=DEFAULT_PROOF)
         return product_id
 
     def create_product(self) -> int:
@@ -51,63 +161,74 @@ class SupplyChainBlockchain:
         return self.product_counter
 
     @staticmethod
-    def hash(block: Dict[str, Any]) -> str:
-        block_copy = block.copy()
-        block_copy.pop("hash", None)
-        block_string = json.dumps(block_copy, sort_keys=True).encode()
-        return hashlib.sha256(block_string).hexdigest()
+    def hash(block: Dict[str, Any]) -> bytes:
+        return hashlib.sha256(_pack_block(block)).digest()
+
+    @property
+    def pending_snapshot(self) -> List[Dict[str, Any]]:
+        """Copy of the buffered transactions; use add_transaction to add more."""
+        return self._pending[:self._pending_n]
 
     @property
     def last_block(self) -> Dict[str, Any]:
         return self.chain[-1]
 
     def is_chain_valid(self) -> bool:
-        for i in range(1, len(self.chain)):
-            prev = self.chain[i - 1]
-            curr = self.chain[i]
-            if curr["previous_hash"] != prev["hash"]:
+        # Sealed blocks are never mutated, so only the links appended since the
+        # last successful check are walked; the tip is still re-hashed in full.
+        for i in range(max(self._valid_through_index, 1), len(self.chain)):
+            if self.chain[i]["previous_hash"] != self.chain[i - 1]["hash"]:
                 return False
-            if curr["hash"] != self.hash(curr):
+        tip = self.chain[-1]
+        if tip["hash"] != self.hash(tip):
+            return False
+        self._valid_through_index = len(self.chain)
+        return True
+
+    def verify_all_hashes(self) -> bool:
+        for i, block in enumerate(self.chain):
+            if block["hash"] != self.hash(block):
                 return False
+            if i and block["previous_hash"] != self.chain[i - 1]["hash"]:
+                return False
+        self._valid_through_index = len(self.chain)
         return True
 
     def track_product(self, product_id: int) -> List[Dict[str, Any]]:
         history = []
-        for block in self.chain:
-            for tx in block["transactions"]:
-                if tx["product_id"] == product_id:
-                    history.append({
-                        "block_index": block["index"],
-                        "actor": tx["actor"],
-                        "location": tx["location"],
-                        "action": tx["action"],
-                        "amount": tx["amount"],
-                        "batch": tx["batch"],
-                        "transport": tx["transport"],
-                        "notes": tx["notes"],
-                        "receiver": tx["receiver"],
-                        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(tx["timestamp"]))
-                    })
+        for block_index, tx in self._by_product.get(product_id, []):
+            history.append({
+                "block_index": block_index,
+                "actor": tx["actor"],
+                "location": tx["location"],
+                "action": tx["action"],
+                "amount": tx["amount"],
+                "batch": tx["batch"],
+                "transport": tx["transport"],
+                "notes": tx["notes"],
+                "receiver": tx["receiver"],
+                "timestamp": tx["timestamp"]
+            })
         return history
 
     def all_transactions_summary(self) -> pd.DataFrame:
-        rows = []
-        for block in self.chain:
-            for tx in block["transactions"]:
-                rows.append({
-                    "Product ID": tx["product_id"],
-                    "Actor": tx["actor"],
-                    "Action": tx["action"],
-                    "Location": tx["location"],
-                    "Amount": tx["amount"],
-                    "Batch": tx["batch"],
-                    "Transport": tx["transport"],
-                    "Notes": tx["notes"],
-                    "Receiver": tx["receiver"],
-                    "Timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(tx["timestamp"])),
-                    "Block": block["index"]
-                })
-        return pd.DataFrame(rows)
+        return _build_summary(self.chain[0]["hash"], len(self.chain), self._cols)
+
+    def recent_transactions_summary(self, n: int = 10) -> pd.DataFrame:
+        return _recent_summary(self.chain[0]["hash"], len(self.chain), self._cols, n)
+
+
+@st.cache_data(show_spinner=False, max_entries=100)
+def _tracked_history(chain_key: bytes, chain_version: int, product_id: int,
+                     _bc: SupplyChainBlockchain) -> pd.DataFrame:
+    history = pd.DataFrame(_bc.track_product(product_id))
+    if not history.empty:
+        history["timestamp"] = _local_datetimes(history["timestamp"])
+    return history
+
+
+def _set_ledger_offset(offset: int) -> None:
+    st.session_state.ledger_offset = offset
 
 
 # -----------------------
@@ -135,9 +256,9 @@ if menu == "🏠 Home":
     col3.metric("Chain Validity", "✅ Yes" if bc.is_chain_valid() else "❌ No")
     
     st.markdown("### 🔹 Recent Steps")
-    all_tx = bc.all_transactions_summary()
-    if not all_tx.empty:
-        st.dataframe(all_tx.tail(10))
+    recent_tx = bc.recent_transactions_summary(10)
+    if not recent_tx.empty:
+        st.dataframe(recent_tx)
     else:
         st.info("No transactions yet.")
 
@@ -165,7 +286,7 @@ elif menu == "📦 Add Step":
         submitted = st.form_submit_button("Add Step")
         if submitted and actor and location and action:
             bc.add_transaction(product_id, actor, location, action, amount, batch, transport, notes, receiver)
-            block = bc.new_block(proof=123)
+            block = bc.new_block(proof=DEFAULT_PROOF)
             st.success(f"✅ Step added for Product #{product_id} in Block {block['index']}.")
 
 # --- Track Product ---
@@ -173,19 +294,27 @@ elif menu == "🔍 Track Product":
     st.header("🔍 Track Product")
     track_id = st.number_input("Enter Product ID to Track", min_value=1, step=1)
     if st.button("Track Product"):
-        history = bc.track_product(track_id)
-        if history:
+        history = _tracked_history(bc.chain[0]["hash"], len(bc.chain), track_id, bc)
+        if not history.empty:
             st.success(f"📜 Product #{track_id} Supply Chain History:")
-            df = pd.DataFrame(history)
-            st.dataframe(df)
+            st.dataframe(history)
         else:
             st.error(f"❌ No record found for Product #{track_id}")
 
 # --- Ledger ---
 elif menu == "📊 Ledger":
     st.header("📊 Blockchain Ledger Explorer")
-    for block in reversed(bc.chain):
-        with st.expander(f"Block {block['index']} (Hash: {block['hash'][:12]}...)"):
-            st.write("Previous Hash:", block.get("previous_hash"))
-            st.write("Hash:", block.get("hash"))
-            st.json(block.get("transactions", []))
+    page_size = 25
+    offset = st.session_state.get("ledger_offset", 0)
+    newest = len(bc.chain) - 1 - offset
+    oldest = max(newest - page_size + 1, 0)
+    for i in range(newest, oldest - 1, -1):
+        block = bc.chain[i]
+        with st.expander(f"Block {block['index']} (Hash: {block['hash'].hex()[:12]}...)"):
+            st.write("Previous Hash:", block["previous_hash"].hex())
+            st.write("Hash:", block["hash"].hex())
+            st.json(block.get("transactions", []), expanded=False)
+    if oldest > 0:
+        st.button("Load older blocks", on_click=_set_ledger_offset, args=(offset + page_size,))
+    if offset:
+        st.button("Back to latest", on_click=_set_ledger_offset, args=(0,))